@@ -23,13 +23,37 @@ def get_ground_truth(image_filename):
     """
     return ALL_LABELS.get(image_filename)
 
+def build_labeled_image_entries():
+    """
+    Menyusun daftar gambar berlabel beserta metadata labelnya.
+    """
+    entries = []
+    for directory, labels in (("choosenCar", CAR_LABELS), ("choosenMotorCycle", MOTORCYCLE_LABELS)):
+        for filename, label in labels.items():
+            entries.append({
+                "path": os.path.join(directory, filename),
+                "filename": filename,
+                "directory": directory,
+                "plat_nomor": label.get("plat_nomor"),
+                "vehicle_type": label.get("vehicle_type")
+            })
+    return entries
+
+# Label hanya dibaca saat start, jadi daftar gambar cukup disusun sekali
+LABELED_IMAGE_ENTRIES = build_labeled_image_entries()
+LABELED_IMAGE_PATHS = [entry["path"] for entry in LABELED_IMAGE_ENTRIES]
+
 def get_labeled_image_paths():
     """
     Mengembalikan daftar path relatif untuk gambar yang dilabeli.
     """
-    car_images = [os.path.join("choosenCar", f) for f in CAR_LABELS.keys()]
-    motorcycle_images = [os.path.join("choosenMotorCycle", f) for f in MOTORCYCLE_LABELS.keys()]
-    return car_images + motorcycle_images
+    return LABELED_IMAGE_PATHS
+
+def get_labeled_image_entries():
+    """
+    Mengembalikan daftar gambar berlabel lengkap dengan plat nomor dan jenis kendaraan.
+    """
+    return LABELED_IMAGE_ENTRIES
 
 def calculate_character_accuracy(detected_text, true_text):
     """
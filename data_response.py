@@ -0,0 +1,145 @@
+import gzip
+import json
+from collections import OrderedDict
+
+from fastapi.responses import Response
+
+# orjson dan brotli opsional: tanpa keduanya respons tetap jalan dengan json standar dan gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_COMPRESS_BYTES = 1024 # Payload kecil tidak sebanding dengan biaya kompresi
+CACHE_MAX_ENTRIES = 32
+
+# Cache body yang sudah diserialisasi/dikompresi: (cache_key, encoding) -> bytes
+_body_cache = OrderedDict()
+
+
+def dumps(content):
+    """Serialisasi ke bytes JSON kompak, memakai orjson jika tersedia."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def records_to_columns(records: dict, key_name: str):
+    """
+    Mengubah {key: {field: value}} menjadi bentuk kolom (array paralel), jauh lebih ringkas
+    untuk riwayat besar karena nama field tidak diulang di setiap record.
+    """
+    fields = []
+    for record in records.values():
+        for field in record:
+            if field not in fields:
+                fields.append(field)
+    columns = {key_name: list(records.keys())}
+    for field in fields:
+        columns[field] = [record.get(field) for record in records.values()]
+    return {"format": "columnar", "count": len(records), "columns": columns}
+
+
+def choose_encoding(accept_encoding: str):
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def encoded_etag(etag: str, encoding: str):
+    """ETag per representasi: '"parking-5-records"' + gzip -> '"parking-5-records-gzip"'."""
+    if encoding == "identity":
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _base_etag(tag: str):
+    """Kebalikan encoded_etag, juga membuang prefix W/."""
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for encoding in ("gzip", "br"):
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def matching_etag(if_none_match: str, etag: str):
+    """
+    Mengembalikan tag dari If-None-Match yang cocok dengan etag (varian encoding mana pun),
+    atau None. Klien yang pindah encoding tetap mendapat 304 selama datanya sama.
+    """
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    for tag in if_none_match.split(","):
+        if _base_etag(tag) == etag:
+            return tag.strip()
+    return None
+
+
+def etag_matches(if_none_match: str, etag: str):
+    return matching_etag(if_none_match, etag) is not None
+
+
+def _encoded_body(cache_key: str, encoding: str, build_content):
+    key = (cache_key, encoding)
+    if key in _body_cache:
+        _body_cache.move_to_end(key)
+        return _body_cache[key]
+
+    raw_key = (cache_key, "identity")
+    raw = _body_cache.get(raw_key)
+    if raw is None:
+        raw = dumps(build_content())
+        _body_cache[raw_key] = raw
+
+    if encoding == "br":
+        body = brotli.compress(raw, quality=5)
+    elif encoding == "gzip":
+        body = gzip.compress(raw, compresslevel=6)
+    else:
+        body = raw
+    _body_cache[key] = body
+    while len(_body_cache) > CACHE_MAX_ENTRIES:
+        _body_cache.popitem(last=False)
+    return body
+
+
+def conditional_json_response(request, etag: str, build_content):
+    """
+    Membuat respons JSON dengan ETag, 304 Not Modified, dan kompresi br/gzip.
+
+    build_content() hanya dipanggil jika body untuk ETag ini belum ada di cache, sehingga
+    request berulang dengan data yang sama tidak membaca ulang maupun menserialisasi ulang data.
+    ETag harus unik untuk setiap versi data dan setiap bentuk respons; respons terkompresi
+    mendapat ETag dengan akhiran encoding (strong ETag berlaku per representasi byte).
+    """
+    headers = {
+        "Cache-Control": "no-cache", # Boleh disimpan browser, tapi selalu divalidasi ulang
+        "Vary": "Accept-Encoding",
+    }
+    matched = matching_etag(request.headers.get("if-none-match"), etag)
+    if matched is not None:
+        headers["ETag"] = matched # 304 memvalidasi representasi yang sudah disimpan klien
+        return Response(status_code=304, headers=headers)
+
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if encoding != "identity" and len(_encoded_body(etag, "identity", build_content)) < MIN_COMPRESS_BYTES:
+        encoding = "identity"
+
+    body = _encoded_body(etag, encoding, build_content)
+    headers["ETag"] = encoded_etag(etag, encoding)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,155 @@
+import datetime
+import gzip
+import json
+import os
+import tempfile
+import zlib
+
+from vehicleIn import load_parking_data, save_parking_data, parse_local_time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVE_DIR = os.path.join(BASE_DIR, "parking_archive")
+MANIFEST_PATH = os.path.join(ARCHIVE_DIR, "manifest.json")
+
+RETENTION_DAYS = 7 # Sesi yang sudah keluar lebih lama dari ini dipindahkan ke arsip
+ARCHIVE_INTERVAL_SECONDS = 3600 # Interval job arsip otomatis di server
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {"partitions": {}}
+    try:
+        with open(MANIFEST_PATH, 'r') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        print(f"Peringatan: {MANIFEST_PATH} rusak, manifest disusun ulang dari file partisi.")
+        return rebuild_manifest()
+
+
+def save_manifest(manifest):
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def partition_path(day: str):
+    return os.path.join(ARCHIVE_DIR, f"{day}.jsonl.gz")
+
+
+def read_partition(day: str):
+    """Membaca semua record dari satu partisi harian (tanpa duplikat)."""
+    path = partition_path(day)
+    if not os.path.exists(path):
+        return []
+    records = {}
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # Baris terakhir terpotong
+                # Kunci unik sesi: plat + waktu masuk. Jika arsip sempat ditulis dua kali, ambil satu saja.
+                records[(record["plat_key"], record.get("entry_time"))] = record
+    except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+        # Ekor file rusak (mis. partisi lama yang ditulis dengan append lalu terputus):
+        # record yang sudah terbaca tetap dipakai
+        print(f"Peringatan: partisi {path} terpotong ({e}), {len(records)} record terbaca.")
+    return list(records.values())
+
+
+def write_partition(day: str, records: list):
+    """Menulis ulang satu partisi secara atomic: file sementara, lalu os.replace."""
+    path = partition_path(day)
+    fd, tmp_path = tempfile.mkstemp(dir=ARCHIVE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def rebuild_manifest():
+    """Menyusun manifest dari file partisi yang ada di ARCHIVE_DIR."""
+    manifest = {"partitions": {}}
+    if not os.path.isdir(ARCHIVE_DIR):
+        return manifest
+    for filename in sorted(os.listdir(ARCHIVE_DIR)):
+        if filename.endswith(".jsonl.gz"):
+            day = filename[:-len(".jsonl.gz")]
+            manifest["partitions"][day] = {"file": filename, "count": len(read_partition(day))}
+    return manifest
+
+
+def archive_closed_sessions(retention_days: int = RETENTION_DAYS, now: datetime.datetime = None):
+    """
+    Memindahkan sesi yang sudah keluar lebih dari retention_days hari dari parking_data.json
+    ke partisi harian terkompresi (parking_archive/YYYY-MM-DD.jsonl.gz, berdasarkan tanggal keluar).
+    Partisi dan manifest ditulis lebih dulu, baru data aktif disimpan, sehingga record tidak
+    pernah hilang jika proses berhenti di tengah jalan. Mengembalikan jumlah record yang diarsipkan.
+    """
+    now = now or datetime.datetime.now()
+    cutoff = now - datetime.timedelta(days=retention_days)
+    parking_data = load_parking_data()
+
+    by_day = {}
+    for plat_key, record in parking_data.items():
+        exit_time = record.get("exit_time")
+        if exit_time is None:
+            continue
+        try:
+            # Waktu dengan offset zona waktu dikonversi ke waktu lokal naive seperti cutoff
+            exit_dt = parse_local_time(exit_time)
+        except (ValueError, TypeError):
+            continue # Biarkan di data aktif agar bisa diperbaiki manual
+        if exit_dt < cutoff:
+            by_day.setdefault(exit_dt.date().isoformat(), []).append((plat_key, record))
+
+    if not by_day:
+        return 0
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    manifest = load_manifest()
+    archived_keys = []
+    for day, items in sorted(by_day.items()):
+        # Gabungkan dengan isi partisi lama lalu tulis ulang secara atomic, sehingga proses yang
+        # berhenti di tengah tidak pernah meninggalkan partisi setengah tertulis.
+        merged = {(r["plat_key"], r.get("entry_time")): r for r in read_partition(day)}
+        for plat_key, record in items:
+            merged[(plat_key, record.get("entry_time"))] = {"plat_key": plat_key, **record}
+        write_partition(day, list(merged.values()))
+        manifest["partitions"][day] = {"file": os.path.basename(partition_path(day)), "count": len(merged)}
+        archived_keys.extend(plat_key for plat_key, _ in items)
+    save_manifest(manifest)
+
+    for plat_key in archived_keys:
+        del parking_data[plat_key]
+    save_parking_data(parking_data)
+    return len(archived_keys)
+
+
+def query_archive(start_date: datetime.date, end_date: datetime.date):
+    """Mengembalikan record arsip dengan tanggal keluar di antara start_date dan end_date (inklusif)."""
+    manifest = load_manifest()
+    records = []
+    for day in sorted(manifest["partitions"]):
+        if start_date.isoformat() <= day <= end_date.isoformat():
+            records.extend(read_partition(day))
+    return records
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Arsipkan sesi parkir yang sudah selesai ke partisi harian.")
+    parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS)
+    args = parser.parse_args()
+    count = archive_closed_sessions(args.retention_days)
+    print(f"{count} sesi diarsipkan ke {ARCHIVE_DIR}")
@@ -0,0 +1,74 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
+IDEMPOTENCY_MAX_ENTRIES = 10000
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """Key yang sama dipakai ulang untuk request dengan isi berbeda."""
+
+
+class IdempotencyStore:
+    """
+    Tabel idempotency di memori dengan TTL dan batas jumlah entri.
+
+    Respons yang sudah selesai disimpan per key dan dikembalikan lagi untuk request berulang.
+    Request dengan key yang sama yang datang saat eksekusi pertama masih berjalan menunggu
+    hasil eksekusi itu (single-flight), sehingga rekognisi dan penulisan file hanya terjadi sekali.
+    """
+
+    def __init__(self, ttl_seconds=IDEMPOTENCY_TTL_SECONDS, max_entries=IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._completed = OrderedDict() # key -> (expires_at, fingerprint, status_code, content)
+        self._in_flight = {} # key -> (fingerprint, asyncio.Future)
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._completed:
+            key, entry = next(iter(self._completed.items()))
+            if entry[0] > now and len(self._completed) <= self.max_entries:
+                break
+            self._completed.popitem(last=False)
+
+    async def run(self, key: str, fingerprint: str, execute):
+        """
+        Menjalankan execute() (coroutine yang mengembalikan (status_code, content)) paling
+        banyak sekali per key. Mengembalikan (status_code, content, replayed).
+        Hasil 5xx dan exception tidak disimpan, supaya klien bisa mencoba ulang dengan key yang sama.
+        """
+        self._evict()
+        stored = self._completed.get(key)
+        if stored is not None:
+            _, stored_fingerprint, status_code, content = stored
+            if stored_fingerprint != fingerprint:
+                raise IdempotencyConflict(key)
+            return status_code, content, True
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            flight_fingerprint, future = in_flight
+            if flight_fingerprint != fingerprint:
+                raise IdempotencyConflict(key)
+            status_code, content = await asyncio.shield(future)
+            return status_code, content, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (fingerprint, future)
+        try:
+            status_code, content = await execute()
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception() # Tandai sudah diambil agar tidak muncul warning "never retrieved"
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+        if status_code < 500:
+            self._completed[key] = (time.monotonic() + self.ttl_seconds, fingerprint, status_code, content)
+            self._evict()
+        future.set_result((status_code, content))
+        return status_code, content, False
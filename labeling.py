@@ -1,11 +1,11 @@
 import os
 import json
-import base64
 import time
 from dotenv import load_dotenv
 from groq import Groq
 from PIL import Image # To ensure we only process valid image files
 import io
+from recognition import recognize_image, RECOGNITION_STATS, PARSE_ERROR, PLATE_NOT_DETECTED, TYPE_UNKNOWN
 
 # Load environment variables from .env
 load_dotenv()
@@ -28,93 +28,30 @@ except Exception as e:
     groq_client = None
     exit()
 
-# --- Helper Groq Analysis Function (adapted from main.py) ---
+# --- Helper Groq Analysis Function (shared with main.py via recognition.py) ---
 async def analyze_image_for_labeling(image_bytes: bytes):
     if not groq_client:
         print("Groq client not initialized.")
         return None
 
-    encoded_image = base64.b64encode(image_bytes).decode('utf-8')
-    
     try:
-        chat_completion = groq_client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Analisa gambar ini dan identifikasi jenis kendaraan (Mobil atau Motor) dan plat nomornya. TANPA PENJELASAN SAMA SEKALI"
-                                    "Jika plat nomor tidak terbaca jelas atau tidak ada, output 'TIDAK_TERDETEKSI' untuk Plat_Nomor. "
-                                    "Jika jenis kendaraan tidak jelas, output 'TIDAK_DIKETAHUI' untuk Vehicle_Type. "
-                                    "Format output HANYA JSON: {\"Vehicle_Type\": \"<jenis>\", \"Plat_Nomor\": \"<plat>\"}. "
-                                    "Pastikan plat nomor hanya mengandung huruf dan angka, tanpa spasi berlebih atau karakter aneh. Jangan ada teks lain selain JSON."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{encoded_image}" 
-                            }
-                        }
-                    ]
-                }
-            ],
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            temperature=0.1,
-            max_tokens=150,
-            # response_format={"type": "json_object"} # Uncomment if model fully supports reliable JSON mode
-        )
-        
-        response_content = chat_completion.choices[0].message.content
-        # print(f"Raw Groq Response for labeling: {response_content}") # Debugging
-
-        json_part = response_content
-        # Try to find JSON block if markdown is present
-        if "```json" in response_content:
-            json_part = response_content.split("```json")[1].split("```")[0].strip()
-        elif response_content.strip().startswith("{") and response_content.strip().endswith("}"):
-            json_part = response_content.strip()
-        else:
-            # If not clearly JSON, attempt to extract it or fail
-            print(f"  Warning: Groq response for labeling doesn't look like clean JSON: {response_content}")
-            # You might need more sophisticated extraction here if this happens often
-            try: # Basic attempt to find a JSON object within the string
-                start_index = response_content.find('{')
-                end_index = response_content.rfind('}') + 1
-                if start_index != -1 and end_index != 0 and end_index > start_index:
-                    json_part = response_content[start_index:end_index]
-                else:
-                    raise ValueError("No JSON object found")
-            except Exception:
-                 print(f"  Could not extract JSON from: {response_content}")
-                 return None
-
-
-        data = json.loads(json_part)
-        
-        plat = data.get("Plat_Nomor", "TIDAK_TERDETEKSI")
-        tipe = data.get("Vehicle_Type", "TIDAK_DIKETAHUI")
+        result = recognize_image(groq_client, image_bytes)
+    except Exception as e:
+        print(f"  An unexpected error occurred during Groq API call: {e}")
+        return None
 
-        # Normalize and validate
-        plat_cleaned = plat.upper().replace(" ", "") if plat else "TIDAK_TERDETEKSI"
-        
-        tipe_capitalized = tipe.capitalize() if tipe else "TIDAK_DIKETAHUI"
-        if tipe_capitalized not in ["Mobil", "Motor", "TIDAK_DIKETAHUI"]:
-            print(f"  Warning: Groq detected an unknown vehicle type: {tipe_capitalized}. Setting to TIDAK_DIKETAHUI.")
-            tipe_capitalized = "TIDAK_DIKETAHUI"
+    plat_cleaned = result["Plat_Nomor"]
+    tipe_capitalized = result["Vehicle_Type"]
 
-        if plat_cleaned == "TIDAK_TERDETEKSI" or tipe_capitalized == "TIDAK_DIKETAHUI":
-            print(f"  Info: Groq could not confidently detect plate/type (Plat: {plat_cleaned}, Type: {tipe_capitalized}). Skipping label update for this image.")
-            return None # Don't add uncertain labels
+    if plat_cleaned == PARSE_ERROR:
+        print(f"  Could not extract JSON from: {result.get('raw_response')}")
+        return None
 
-        return {"Vehicle_Type": tipe_capitalized, "Plat_Nomor": plat_cleaned}
+    if plat_cleaned == PLATE_NOT_DETECTED or tipe_capitalized == TYPE_UNKNOWN:
+        print(f"  Info: Groq could not confidently detect plate/type (Plat: {plat_cleaned}, Type: {tipe_capitalized}). Skipping label update for this image.")
+        return None # Don't add uncertain labels
 
-    except json.JSONDecodeError as e:
-        print(f"  Error parsing Groq JSON response: {e}. Content: {response_content}")
-        return None
-    except Exception as e:
-        print(f"  An unexpected error occurred during Groq API call: {e}")
-        return None
+    return {"Vehicle_Type": tipe_capitalized, "Plat_Nomor": plat_cleaned}
 
 # --- Directory Processing Function ---
 async def process_directory(dir_path):
@@ -208,6 +145,7 @@ async def main():
         await process_directory(directory)
     
     print("\n--- Labeling Process Finished ---")
+    print(f"Groq requests: {RECOGNITION_STATS['requests']}, parse failures: {RECOGNITION_STATS['parse_failures']}")
     print("Please review and correct the generated 'labels.json' files in each directory.")
 
 if __name__ == "__main__":
@@ -1,10 +1,12 @@
 import os
 import json
-import base64
-import time 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+import asyncio
+import datetime
+import hashlib
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, UploadFile, Form, Header, HTTPException, Request, Query
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from groq import Groq
@@ -12,15 +14,39 @@ from PIL import Image # Untuk validasi gambar
 import io
 
 # Impor fungsi dari modul lain
-from vehicleIn import process_entry, load_parking_data as load_current_parking_data
+from vehicleIn import process_entry, get_data_version, parse_local_time, load_parking_data as load_current_parking_data
 from vehicleOut import process_exit
-from accuracy_helper import calculate_accuracy, get_ground_truth, get_labeled_image_paths, LABELED_CAR_DIR, LABELED_MOTORCYCLE_DIR
+from accuracy_helper import calculate_accuracy, get_ground_truth, get_labeled_image_paths, get_labeled_image_entries, LABELED_CAR_DIR, LABELED_MOTORCYCLE_DIR
+from data_response import conditional_json_response, records_to_columns
+from idempotency import IdempotencyStore, IdempotencyConflict, MAX_KEY_LENGTH
+from history_archive import archive_closed_sessions, query_archive, ARCHIVE_INTERVAL_SECONDS
+from thumbnail_cache import get_thumbnail, thumbnail_key, content_version, normalize_width, normalize_format, DEFAULT_WIDTH, DEFAULT_FORMAT, FORMAT_MEDIA_TYPES
+from recognition import recognize_image, RECOGNITION_STATS
+from recognition_queue import RecognitionQueue, RetryableRecognitionError
 
 # Load environment variables dari .env
 load_dotenv()
 
+
+# Antrian rekognisi dan job arsip (didefinisikan di bawah) berjalan selama server hidup
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start: jalankan antrian rekognisi dan job arsip. Shutdown: hentikan keduanya."""
+    await recognition_queue.start()
+    archive_task = asyncio.create_task(run_history_archival())
+    try:
+        yield
+    finally:
+        archive_task.cancel()
+        try:
+            await archive_task
+        except asyncio.CancelledError:
+            pass
+        await recognition_queue.stop()
+
+
 # Inisialisasi FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Setup CORS
 app.add_middleware(
@@ -48,75 +74,21 @@ app.mount("/choosenCar", StaticFiles(directory=LABELED_CAR_DIR), name="choosenCa
 app.mount("/choosenMotorCycle", StaticFiles(directory=LABELED_MOTORCYCLE_DIR), name="choosenMotorCycle")
 
 
+# Label hanya dibaca saat start, jadi ETag daftar gambar cukup dihitung sekali
+LABELED_IMAGES_ETAG = '"labeled-' + hashlib.sha256("\n".join(get_labeled_image_paths()).encode()).hexdigest()[:16] + '"'
+
+
+# Respons /process_image/ per Idempotency-Key (TTL + batas jumlah entri)
+idempotency_store = IdempotencyStore()
+
+
 # --- Helper Groq ---
 async def analyze_image_with_groq(image_bytes: bytes):
     if not groq_client:
         raise HTTPException(status_code=500, detail="Groq client tidak terinisialisasi. Cek API Key.")
 
-    # Encode image to base64
-    encoded_image = base64.b64encode(image_bytes).decode('utf-8')
-    
-    start_time = time.time() # <--- Record start time
-
-    chat_completion = groq_client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": "Analisa gambar ini dan identifikasi jenis kendaraan (Mobil atau Motor) dan plat nomornya. JANGAN MEMBERIKAN PENJELASAN SAMA SEKALI. "
-                                "Jika plat nomor tidak terbaca jelas atau tidak ada, tulis 'TIDAK_TERDETEKSI'. "
-                                "Jika jenis kendaraan tidak jelas, tulis 'TIDAK_DIKETAHUI'. "
-                                "Format output JSON: {\"Vehicle_Type\": \"<jenis>\", \"Plat_Nomor\": \"<plat>\"}."
-                                "Pastikan plat nomor hanya mengandung huruf dan angka, tanpa spasi berlebih atau karakter aneh."
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                             "url": f"data:image/jpeg;base64,{encoded_image}"
-                        }
-                    }
-                ]
-            }
-        ],
-        model="meta-llama/llama-4-scout-17b-16e-instruct",
-        temperature=0.1,
-        max_tokens=150,
-    )
-    
-    end_time = time.time() # <--- Record end time
-    inference_time_seconds = round(end_time - start_time, 3) # <--- Calculate duration
-
-    response_content = chat_completion.choices[0].message.content
-    # print(f"Raw Groq Response: {response_content}") 
-    try:
-        # Mencoba membersihkan dan parsing JSON
-        # Llama Vision mungkin tidak selalu menghasilkan JSON yang sempurna, perlu pre-processing
-        json_part = response_content
-        if "```json" in response_content:
-            json_part = response_content.split("```json")[1].split("```")[0].strip()
-        
-        data = json.loads(json_part)
-        
-        # Normalisasi hasil
-        plat = data.get("Plat_Nomor", "TIDAK_TERDETEKSI").upper().replace(" ", "")
-        tipe = data.get("Vehicle_Type", "TIDAK_DIKETAHUI").capitalize()
-        if tipe not in ["Mobil", "Motor"]:
-            tipe = "TIDAK_DIKETAHUI"
-
-        return {
-            "Vehicle_Type": tipe, 
-            "Plat_Nomor": plat,
-            "inference_time_seconds": inference_time_seconds # <--- Include inference time
-        }
-    except (json.JSONDecodeError, AttributeError, IndexError) as e:
-        print(f"Error parsing Groq JSON response: {e}, Content: {response_content}")
-        return {
-            "Vehicle_Type": "ERROR_PARSING", 
-            "Plat_Nomor": "ERROR_PARSING",
-            "inference_time_seconds": inference_time_seconds # <--- Still return time even on parse error
-        }
+    # Client Groq bersifat blocking, jalankan di thread agar event loop tetap responsif
+    return await asyncio.to_thread(recognize_image, groq_client, image_bytes)
 
 
 # --- API Endpoints ---
@@ -134,7 +106,10 @@ async def read_root():
 async def process_image_endpoint(
     action_type: str = Form(...),  # 'in' atau 'out'
     image_file: UploadFile = File(None), # Bisa None jika pakai labeled_image_name
-    labeled_image_name: str = Form(None) # Nama file gambar dari folder berlabel
+    labeled_image_name: str = Form(None), # Nama file gambar dari folder berlabel
+    async_mode: bool = Form(False), # Jika True, rekognisi dijalankan di antrian dan job id dikembalikan (202)
+    captured_at: str = Form(None), # Waktu pengambilan gambar (ISO); offset zona waktu dikonversi ke waktu lokal server
+    idempotency_key: str = Header(None) # Header Idempotency-Key: request berulang dengan key sama tidak diproses dua kali
 ):
     image_bytes = None
     actual_image_filename_for_gt = None # Nama file untuk dicocokkan dengan ground truth
@@ -173,42 +148,87 @@ async def process_image_endpoint(
     else:
         raise HTTPException(status_code=400, detail="Tidak ada gambar yang diunggah atau dipilih.")
 
-    groq_analysis_result = None # Initialize
-    try:
-        groq_analysis_result = await analyze_image_with_groq(image_bytes) # <--- Store the whole result
-    except HTTPException as e: 
-        return JSONResponse(status_code=e.status_code, content={"status": "error", "message": e.detail})
-    except Exception as e:
-        print(f"Error saat analisa Groq: {e}")
-        return JSONResponse(status_code=500, content={"status": "error", "message": f"Gagal menganalisa gambar dengan Groq: {str(e)}"})
+    # Fingerprint isi request, untuk mendeteksi Idempotency-Key yang dipakai ulang dengan gambar/aksi lain
+    request_fingerprint = hashlib.sha256(
+        f"{action_type}|{async_mode}|{captured_at}|".encode() + image_bytes
+    ).hexdigest()
+
+    async def execute():
+        if async_mode:
+            if action_type not in ("in", "out"):
+                raise HTTPException(status_code=400, detail="Action type tidak valid.")
+            if captured_at:
+                try:
+                    event_time = parse_local_time(captured_at).isoformat()
+                except ValueError:
+                    raise HTTPException(status_code=400, detail="Format captured_at tidak valid (gunakan ISO 8601).")
+            else:
+                event_time = datetime.datetime.now().isoformat()
+            job = recognition_queue.submit(action_type, image_bytes, event_time, actual_image_filename_for_gt)
+            return 202, {
+                "status": "queued",
+                "message": "Gambar diterima dan menunggu diproses.",
+                "job_id": job["job_id"],
+                "status_url": f"/jobs/{job['job_id']}"
+            }
+
+        groq_analysis_result = None # Initialize
+        try:
+            groq_analysis_result = await analyze_image_with_groq(image_bytes) # <--- Store the whole result
+        except HTTPException as e: 
+            return e.status_code, {"status": "error", "message": e.detail}
+        except Exception as e:
+            print(f"Error saat analisa Groq: {e}")
+            return 500, {"status": "error", "message": f"Gagal menganalisa gambar dengan Groq: {str(e)}"}
+
+        return build_process_result(action_type, groq_analysis_result, actual_image_filename_for_gt)
+
+    if not idempotency_key:
+        status_code, content = await execute()
+        return JSONResponse(status_code=status_code, content=content)
 
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key maksimal {MAX_KEY_LENGTH} karakter.")
+    try:
+        status_code, content, replayed = await idempotency_store.run(idempotency_key, request_fingerprint, execute)
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key sudah dipakai untuk request dengan isi berbeda.")
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return JSONResponse(status_code=status_code, content=content, headers=headers)
+
+
+def build_process_result(action_type: str, groq_analysis_result: dict, actual_image_filename_for_gt: str = None, event_time: str = None):
+    """
+    Menerapkan hasil Groq ke data parkir (masuk/keluar) dan menghitung akurasi.
+    Dipakai oleh endpoint sinkron maupun worker antrian. Mengembalikan (status_code, content).
+    """
     # The groq_analysis_result now contains Vehicle_Type, Plat_Nomor, and inference_time_seconds
     # print(f"Groq Analysis Result: {groq_analysis_result}") # For debugging
 
     if groq_analysis_result["Vehicle_Type"] == "ERROR_PARSING" or groq_analysis_result["Plat_Nomor"] == "ERROR_PARSING":
-        return JSONResponse(status_code=500, content={
+        return 500, {
             "status": "error", 
             "message": "Gagal memparsing hasil dari Groq.",
             "groq_result": groq_analysis_result # Send the result which includes time
-        })
+        }
     
     if groq_analysis_result["Plat_Nomor"] == "TIDAK_TERDETEKSI" or groq_analysis_result["Vehicle_Type"] == "TIDAK_DIKETAHUI":
-         return JSONResponse(status_code=400, content={
+        return 400, {
             "status": "error", 
             "message": "Plat nomor atau jenis kendaraan tidak dapat dideteksi oleh Groq.",
             "groq_result": groq_analysis_result # Send the result which includes time
-        })
+        }
 
     plat_nomor = groq_analysis_result["Plat_Nomor"]
     vehicle_type = groq_analysis_result["Vehicle_Type"]
 
     # Proses berdasarkan action_type
     if action_type == "in":
-        result = process_entry(plat_nomor, vehicle_type)
+        result = process_entry(plat_nomor, vehicle_type, event_time)
     elif action_type == "out":
-        result = process_exit(plat_nomor, vehicle_type) # Kirim vehicle_type hasil deteksi
+        result = process_exit(plat_nomor, vehicle_type, event_time) # Kirim vehicle_type hasil deteksi
     else:
-        raise HTTPException(status_code=400, detail="Action type tidak valid.")
+        return 400, {"status": "error", "message": "Action type tidak valid."}
 
     # Kalkulasi akurasi jika gambar yang diproses adalah gambar yang dilabeli
     accuracy_info = None
@@ -237,17 +257,189 @@ async def process_image_endpoint(
     
     # print(f"Final Response: {final_response}") # Debugging output
     
-    return JSONResponse(content=final_response)
+    return 200, final_response
+
+
+def apply_queued_recognition(job: dict, groq_analysis_result: dict):
+    """Callback antrian: hasil parsing gagal dicoba ulang, selain itu diterapkan dengan waktu pengambilan gambar."""
+    if groq_analysis_result["Vehicle_Type"] == "ERROR_PARSING" or groq_analysis_result["Plat_Nomor"] == "ERROR_PARSING":
+        raise RetryableRecognitionError("Gagal memparsing hasil dari Groq.")
+    return build_process_result(
+        job["action_type"], groq_analysis_result,
+        job.get("image_filename_for_gt"), job.get("captured_at")
+    )
+
+
+recognition_queue = RecognitionQueue(analyze_image_with_groq, apply_queued_recognition)
+
+
+async def run_history_archival():
+    # Dijalankan langsung di event loop (bukan thread) supaya tidak bersaing dengan process_entry/process_exit
+    while True:
+        try:
+            archived = archive_closed_sessions()
+            if archived:
+                print(f"{archived} sesi parkir lama dipindahkan ke arsip.")
+        except Exception as e:
+            print(f"Error saat mengarsipkan riwayat parkir: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+
+@app.get("/jobs/{job_id}")
+async def get_recognition_job(job_id: str, wait: float = 0):
+    """
+    Mengembalikan status job rekognisi asinkron.
+    Jika wait > 0 (detik, maks 30), request ditahan sampai job selesai (long-poll).
+    """
+    job = await recognition_queue.wait_for_job(job_id, min(max(wait, 0), 30))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} tidak ditemukan.")
+    return JSONResponse(content=job)
+
+@app.post("/jobs/{job_id}/requeue")
+async def requeue_recognition_job(job_id: str):
+    """Menjalankan ulang job yang gagal (gambar job gagal disimpan sampai di-requeue atau di-dismiss)."""
+    try:
+        job = recognition_queue.requeue(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} tidak ditemukan.")
+    return JSONResponse(status_code=202, content=job)
+
+@app.post("/jobs/{job_id}/dismiss")
+async def dismiss_recognition_job(job_id: str):
+    """Menandai job gagal sudah ditangani: gambarnya dihapus dan job boleh dipangkas dari jobs.json."""
+    try:
+        job = recognition_queue.dismiss(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} tidak ditemukan.")
+    return JSONResponse(content=job)
 
 @app.get("/parking_data")
-async def get_parking_data():
-    """Mengembalikan semua data parkir saat ini."""
-    return JSONResponse(content=load_current_parking_data())
+async def get_parking_data(request: Request, format: str = Query("records", pattern="^(records|columnar)$")):
+    """
+    Mengembalikan semua data parkir saat ini.
+    format=columnar mengembalikan array paralel per field (lebih ringkas untuk riwayat besar).
+    Mendukung If-None-Match: jika data belum berubah, dikembalikan 304.
+    """
+    def build_content():
+        data = load_current_parking_data()
+        return records_to_columns(data, "plat_key") if format == "columnar" else data
+
+    etag = f'"parking-{get_data_version()}-{format}"'
+    return conditional_json_response(request, etag, build_content)
+
+@app.get("/recognition_stats")
+async def get_recognition_stats():
+    """Mengembalikan jumlah request Groq, parsing berhasil/gagal, dan stream yang dihentikan lebih awal."""
+    return JSONResponse(content=RECOGNITION_STATS)
+
+@app.get("/parking_history")
+async def get_parking_history(request: Request, start: datetime.date, end: datetime.date):
+    """
+    Mengembalikan sesi parkir yang keluar antara tanggal start dan end (inklusif, YYYY-MM-DD).
+    Hanya partisi arsip dalam rentang yang dibaca, ditambah sesi selesai yang masih di data aktif.
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="Tanggal end harus sama atau setelah start.")
+
+    def build_content():
+        records = query_archive(start, end)
+        for plat_key, record in load_current_parking_data().items():
+            if not record.get("exit_time"):
+                continue
+            try:
+                exit_date = parse_local_time(record["exit_time"]).date()
+            except (ValueError, TypeError):
+                continue # Record dengan waktu keluar rusak dilewati, sama seperti saat pengarsipan
+            if start <= exit_date <= end:
+                records.append({"plat_key": plat_key, **record})
+        records.sort(key=lambda r: str(r["exit_time"]))
+        return {"start": start.isoformat(), "end": end.isoformat(), "count": len(records), "records": records}
+
+    # Pengarsipan selalu menyimpan ulang data aktif, jadi versi data juga mencakup perubahan arsip
+    etag = f'"history-{get_data_version()}-{start.isoformat()}-{end.isoformat()}"'
+    return conditional_json_response(request, etag, build_content)
 
 @app.get("/labeled_images")
-async def get_list_of_labeled_images():
+async def get_list_of_labeled_images(request: Request):
     """Mengembalikan daftar file gambar yang sudah dilabeli."""
-    return JSONResponse(content={"images": get_labeled_image_paths()})
+    return conditional_json_response(request, LABELED_IMAGES_ETAG, lambda: {"images": get_labeled_image_paths()})
+
+@app.get("/labeled_images/page")
+async def get_labeled_images_page(
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=200),
+    vehicle_type: str = None # Filter opsional: "Mobil" atau "Motor"
+):
+    """Mengembalikan satu halaman gambar berlabel beserta label dan URL thumbnail-nya."""
+    entries = get_labeled_image_entries()
+    if vehicle_type:
+        entries = [e for e in entries if (e["vehicle_type"] or "").lower() == vehicle_type.lower()]
+    start = (page - 1) * page_size
+    page_entries = entries[start:start + page_size]
+
+    def with_thumbnail(entry):
+        try:
+            version = content_version(os.path.join(BASE_DIR, entry["path"]))
+        except OSError:
+            # File dihapus/dipindah setelah daftar dibuat: entri tetap dikirim, tanpa thumbnail
+            return {**entry, "thumbnail_url": None}
+        url_path = entry["path"].replace(os.sep, "/")
+        return {**entry, "thumbnail_url": f"/thumbnail/{url_path}?width={DEFAULT_WIDTH}&v={version}"}
+
+    images = await asyncio.to_thread(lambda: [with_thumbnail(e) for e in page_entries])
+    return JSONResponse(content={
+        "images": images,
+        "page": page,
+        "page_size": page_size,
+        "total": len(entries)
+    })
+
+@app.get("/thumbnail/{image_path:path}")
+async def get_image_thumbnail(
+    image_path: str,
+    request: Request,
+    width: int = Query(DEFAULT_WIDTH, ge=1),
+    format: str = DEFAULT_FORMAT,
+    v: str = None # Versi konten dari /labeled_images/page; jika cocok, respons boleh di-cache permanen
+):
+    """
+    Menyajikan thumbnail gambar berlabel (WebP/JPEG) dari cache di disk.
+    ETag berbasis konten, sehingga browser cukup menerima 304 untuk gambar yang sama.
+    """
+    source_path = os.path.realpath(os.path.join(BASE_DIR, image_path))
+    allowed_dirs = [os.path.realpath(d) for d in (LABELED_CAR_DIR, LABELED_MOTORCYCLE_DIR)]
+    if not any(source_path.startswith(d + os.sep) for d in allowed_dirs) or not os.path.isfile(source_path):
+        raise HTTPException(status_code=404, detail=f"Gambar {image_path} tidak ditemukan.")
+
+    fmt = normalize_format(format)
+    width = normalize_width(width)
+    try:
+        key = await asyncio.to_thread(thumbnail_key, source_path, width, fmt)
+    except OSError:
+        raise HTTPException(status_code=404, detail=f"Gambar {image_path} tidak ditemukan.")
+
+    etag = f'"{key}"'
+    if v and v == content_version(source_path):
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, max-age=0, must-revalidate"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+
+    # Cek If-None-Match sebelum membuat thumbnail, supaya 304 tidak memicu pembuatan file
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    try:
+        thumb_path, _ = await asyncio.to_thread(get_thumbnail, source_path, width, fmt)
+    except OSError:
+        raise HTTPException(status_code=400, detail=f"File {image_path} bukan gambar yang valid.")
+    return FileResponse(thumb_path, media_type=FORMAT_MEDIA_TYPES[fmt], headers=headers)
 
 
 # Untuk menjalankan aplikasi: uvicorn main:app --reload
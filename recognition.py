@@ -0,0 +1,192 @@
+import base64
+import json
+import re
+import time
+
+# Prompt, parsing, dan normalisasi hasil Groq yang dipakai bersama oleh main.py dan labeling.py
+
+MODEL_NAME = "meta-llama/llama-4-scout-17b-16e-instruct"
+TEMPERATURE = 0.1
+MAX_TOKENS = 100 # Objek JSON yang diharapkan hanya ~30 token; streaming dihentikan begitu objek lengkap
+
+PLATE_NOT_DETECTED = "TIDAK_TERDETEKSI"
+PLATE_NOT_DETECTED_KEY = re.sub(r"[^A-Z0-9]", "", PLATE_NOT_DETECTED) # Sentinel setelah normalisasi plat
+TYPE_UNKNOWN = "TIDAK_DIKETAHUI"
+PARSE_ERROR = "ERROR_PARSING"
+
+PROMPT = (
+    "Analisa gambar ini dan identifikasi jenis kendaraan (Mobil atau Motor) dan plat nomornya. JANGAN MEMBERIKAN PENJELASAN SAMA SEKALI. "
+    f"Jika plat nomor tidak terbaca jelas atau tidak ada, output '{PLATE_NOT_DETECTED}' untuk Plat_Nomor. "
+    f"Jika jenis kendaraan tidak jelas, output '{TYPE_UNKNOWN}' untuk Vehicle_Type. "
+    "Format output HANYA JSON: {\"Vehicle_Type\": \"<jenis>\", \"Plat_Nomor\": \"<plat>\"}. "
+    "Pastikan plat nomor hanya mengandung huruf dan angka, tanpa spasi berlebih atau karakter aneh. Jangan ada teks lain selain JSON."
+)
+
+# Sinonim yang kadang dipakai model untuk jenis kendaraan
+VEHICLE_TYPE_ALIASES = {
+    "mobil": "Mobil",
+    "car": "Mobil",
+    "motor": "Motor",
+    "motorcycle": "Motor",
+    "sepeda motor": "Motor",
+    "motorbike": "Motor",
+}
+
+# Penghitung sederhana untuk memantau seberapa sering parsing gagal
+RECOGNITION_STATS = {
+    "requests": 0,
+    "parsed": 0,
+    "parse_failures": 0,
+    "early_stops": 0, # Stream dihentikan sebelum model selesai menghasilkan token
+}
+
+
+class JsonObjectScanner:
+    """
+    Parser inkremental: potongan teks dari stream dimasukkan lewat feed(), dan objek JSON
+    pertama yang lengkap (kurung kurawal seimbang, di luar string) dikembalikan segera.
+    Teks lain di sekitarnya (```json, penjelasan) diabaikan.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str):
+        self.buffer += text
+        while self._pos < len(self.buffer):
+            char = self.buffer[self._pos]
+            self._pos += 1
+            if self._start == -1:
+                if char == "{":
+                    self._start = self._pos - 1
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = self.buffer[self._start:self._pos]
+                    self._start = -1
+                    try:
+                        data = json.loads(candidate)
+                    except json.JSONDecodeError:
+                        continue # Bukan JSON valid, cari objek berikutnya
+                    if isinstance(data, dict):
+                        return data
+        return None
+
+
+def is_recognition_object(data: dict):
+    return "Plat_Nomor" in data or "Vehicle_Type" in data
+
+
+def normalize_recognition(data: dict):
+    """
+    Normalisasi hasil mentah model menjadi {"Vehicle_Type", "Plat_Nomor"}.
+    Plat: huruf besar, hanya huruf dan angka. Jenis: "Mobil", "Motor", atau TIDAK_DIKETAHUI.
+    """
+    plat = data.get("Plat_Nomor")
+    plat = re.sub(r"[^A-Z0-9]", "", str(plat).upper()) if plat else ""
+    # "TIDAK TERDETEKSI", "tidak-terdeteksi", dst. juga berarti plat tidak terbaca, bukan plat "TIDAKTERDETEKSI"
+    if not plat or plat == PLATE_NOT_DETECTED_KEY:
+        plat = PLATE_NOT_DETECTED
+
+    tipe = data.get("Vehicle_Type")
+    tipe = VEHICLE_TYPE_ALIASES.get(str(tipe).strip().lower(), TYPE_UNKNOWN) if tipe else TYPE_UNKNOWN
+
+    return {"Vehicle_Type": tipe, "Plat_Nomor": plat}
+
+
+def build_messages(image_bytes: bytes):
+    encoded_image = base64.b64encode(image_bytes).decode('utf-8')
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": PROMPT},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{encoded_image}"
+                    }
+                }
+            ]
+        }
+    ]
+
+
+def recognize_image(groq_client, image_bytes: bytes):
+    """
+    Mengirim gambar ke Groq dalam mode streaming dan berhenti begitu objek
+    {Vehicle_Type, Plat_Nomor} lengkap terbaca.
+
+    Mengembalikan dict hasil normalisasi ditambah inference_time_seconds. Jika tidak ada
+    objek JSON yang bisa diparsing, kedua field berisi ERROR_PARSING dan raw_response diisi.
+    Error API tidak ditangkap di sini; pemanggil yang memutuskan cara menanganinya.
+    """
+    # Catatan: JSON mode (response_format) Groq tidak bisa digabung dengan streaming,
+    # jadi format dipaksa lewat prompt dan dibaca oleh JsonObjectScanner.
+    RECOGNITION_STATS["requests"] += 1
+    start_time = time.time()
+    stream = groq_client.chat.completions.create(
+        messages=build_messages(image_bytes),
+        model=MODEL_NAME,
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+        stream=True,
+    )
+
+    scanner = JsonObjectScanner()
+    data = None
+    finished = False
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.delta and choice.delta.content:
+                data = scanner.feed(choice.delta.content)
+                # Satu chunk bisa berisi beberapa objek; lanjutkan scan sisa buffer sebelum chunk berikutnya
+                while data is not None and not is_recognition_object(data):
+                    data = scanner.feed("")
+                if data is not None:
+                    break
+            if choice.finish_reason is not None:
+                finished = True
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close() # Menutup koneksi agar model berhenti menghasilkan token
+
+    inference_time_seconds = round(time.time() - start_time, 3)
+
+    if data is None:
+        RECOGNITION_STATS["parse_failures"] += 1
+        print(f"Error parsing Groq JSON response, Content: {scanner.buffer}")
+        return {
+            "Vehicle_Type": PARSE_ERROR,
+            "Plat_Nomor": PARSE_ERROR,
+            "inference_time_seconds": inference_time_seconds,
+            "raw_response": scanner.buffer,
+        }
+
+    RECOGNITION_STATS["parsed"] += 1
+    if not finished:
+        RECOGNITION_STATS["early_stops"] += 1
+    return {**normalize_recognition(data), "inference_time_seconds": inference_time_seconds}
@@ -0,0 +1,409 @@
+import asyncio
+import datetime
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+from recognition import PARSE_ERROR, PLATE_NOT_DETECTED
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+JOBS_DIR = os.path.join(BASE_DIR, "recognition_jobs")
+JOB_IMAGES_DIR = os.path.join(JOBS_DIR, "images")
+JOBS_FILE_PATH = os.path.join(JOBS_DIR, "jobs.json")
+
+WORKER_COUNT = 2 # Jumlah worker yang menjalankan rekognisi secara paralel
+RETRY_DEADLINE_SECONDS = 24 * 60 * 60 # Error API/timeout dicoba ulang selama ini sejak job dibuat
+MAX_PARSE_ATTEMPTS = 6 # API menjawab tapi output tidak bisa diparsing: dibatasi per jumlah percobaan
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 300
+BREAKER_FAILURE_THRESHOLD = 5 # Kegagalan beruntun sebelum circuit breaker terbuka
+BREAKER_RESET_SECONDS = 60
+FINISHED_JOB_TTL_SECONDS = 3600 # Hasil job selesai bisa di-poll selama ini, lalu dihapus
+FINISHED_JOB_MAX = 200 # Batas jumlah job selesai yang disimpan, agar jobs.json tidak tumbuh terus
+# Job gagal (beserta gambarnya) disimpan sampai operator memprosesnya lewat requeue() atau dismiss()
+
+# Status job
+STATUS_QUEUED = "queued"
+STATUS_PROCESSING = "processing"
+STATUS_RETRYING = "retrying"
+STATUS_WAITING = "waiting" # Sudah dikenali, menunggu job lebih awal untuk plat yang sama
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+PENDING_STATUSES = (STATUS_QUEUED, STATUS_PROCESSING, STATUS_RETRYING, STATUS_WAITING)
+
+
+class RetryableRecognitionError(Exception):
+    """Kegagalan sementara (API down, timeout, output tidak bisa diparsing) yang layak dicoba ulang."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker sederhana: setelah beberapa kegagalan beruntun, panggilan ke API
+    ditahan selama reset_seconds, lalu satu panggilan percobaan (half-open) diizinkan.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def seconds_until_retry(self):
+        if self.opened_at is None:
+            return 0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def allow_request(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.trial_in_flight or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+
+def backoff_delay(attempts: int):
+    """Exponential backoff dengan jitter: 2, 4, 8, ... detik, dibatasi BACKOFF_MAX_SECONDS."""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class RecognitionQueue:
+    """
+    Antrian rekognisi lokal yang tahan restart.
+
+    Gambar disimpan ke disk dan status setiap job ditulis ke jobs.json, sehingga job yang
+    belum selesai dilanjutkan kembali saat server start. `recognize(image_bytes)` memanggil
+    model, sedangkan `apply_result(job, recognition_result)` mencatat masuk/keluar kendaraan
+    dan mengembalikan (status_code, content) seperti respons endpoint sinkron.
+    """
+
+    def __init__(self, recognize, apply_result, worker_count=WORKER_COUNT):
+        self.recognize = recognize
+        self.apply_result = apply_result
+        self.worker_count = worker_count
+        self.breaker = CircuitBreaker()
+        self.jobs = {}
+        self._file_lock = threading.Lock()
+        self._queue = None
+        self._workers = []
+        self._events = {}
+        self._waiting = set() # job_id yang ditahan sampai job sebelumnya untuk plat yang sama selesai
+        self._load_jobs()
+
+    # --- Persistensi ---
+    def _load_jobs(self):
+        if not os.path.exists(JOBS_FILE_PATH):
+            return
+        try:
+            with open(JOBS_FILE_PATH, 'r') as f:
+                self.jobs = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Peringatan: {JOBS_FILE_PATH} rusak. Memulai antrian kosong.")
+            self.jobs = {}
+        self._prune_finished()
+
+    def _prune_finished(self):
+        """
+        Menghapus job selesai (atau gagal yang sudah di-dismiss) yang lebih tua dari
+        FINISHED_JOB_TTL_SECONDS atau melebihi FINISHED_JOB_MAX. Job gagal yang belum
+        ditangani tidak pernah dihapus otomatis.
+        """
+        cutoff = (datetime.datetime.now() - datetime.timedelta(seconds=FINISHED_JOB_TTL_SECONDS)).isoformat()
+        finished = sorted(
+            (job for job in self.jobs.values()
+             if job["status"] == STATUS_DONE or (job["status"] == STATUS_FAILED and job.get("dismissed"))),
+            key=lambda job: job["updated_at"]
+        )
+        excess = len(finished) - FINISHED_JOB_MAX
+        for index, job in enumerate(finished):
+            if index < excess or job["updated_at"] < cutoff:
+                del self.jobs[job["job_id"]]
+
+    def _save_jobs(self):
+        with self._file_lock:
+            os.makedirs(JOBS_DIR, exist_ok=True)
+            tmp_path = JOBS_FILE_PATH + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.jobs, f, separators=(",", ":"))
+            os.replace(tmp_path, JOBS_FILE_PATH) # Atomic, jobs.json tidak pernah setengah tertulis
+
+    # --- API publik ---
+    def submit(self, action_type: str, image_bytes: bytes, captured_at: str, image_filename_for_gt: str = None):
+        """Menyimpan gambar, mencatat job baru, dan memasukkannya ke antrian. Mengembalikan job."""
+        job_id = uuid.uuid4().hex
+        os.makedirs(JOB_IMAGES_DIR, exist_ok=True)
+        image_path = os.path.join(JOB_IMAGES_DIR, f"{job_id}.img")
+        with open(image_path, "wb") as f:
+            f.write(image_bytes)
+
+        now = datetime.datetime.now().isoformat()
+        job = {
+            "job_id": job_id,
+            "action_type": action_type,
+            "image_path": os.path.relpath(image_path, BASE_DIR),
+            "image_filename_for_gt": image_filename_for_gt,
+            "captured_at": captured_at,
+            "status": STATUS_QUEUED,
+            "attempts": 0,
+            "parse_failures": 0,
+            "next_attempt_at": None,
+            "last_error": None,
+            "status_code": None,
+            "result": None,
+            "plat_nomor": None, # Diisi setelah rekognisi, dipakai untuk mengurutkan job per plat
+            "recognition_result": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.jobs[job_id] = job
+        self._save_jobs()
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+        return job
+
+    def get_job(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        public_job = {k: v for k, v in job.items() if k != "image_path"}
+        public_job["circuit_state"] = self.breaker.state
+        return public_job
+
+    async def wait_for_job(self, job_id: str, timeout: float):
+        """Menunggu (long-poll) sampai job selesai atau timeout habis."""
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] not in PENDING_STATUSES or timeout <= 0:
+            return self.get_job(job_id)
+        event = self._events.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.get_job(job_id)
+
+    def requeue(self, job_id: str):
+        """
+        Menjalankan ulang job yang gagal dari awal (rekognisi ulang, tenggat retry baru).
+        Mengembalikan job, None jika tidak ada, atau melempar ValueError jika job tidak gagal
+        atau gambarnya sudah tidak ada.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        if job["status"] != STATUS_FAILED or job.get("dismissed"):
+            raise ValueError("Hanya job gagal yang belum di-dismiss yang bisa dijalankan ulang.")
+        if not os.path.exists(os.path.join(BASE_DIR, job["image_path"])):
+            raise ValueError("File gambar job sudah tidak ada.")
+        now = datetime.datetime.now().isoformat()
+        job.update(status=STATUS_QUEUED, attempts=0, parse_failures=0, next_attempt_at=None,
+                   last_error=None, status_code=None, result=None, plat_nomor=None,
+                   recognition_result=None, retry_since=now)
+        self._update(job)
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+        return job
+
+    def dismiss(self, job_id: str):
+        """
+        Menandai job gagal sudah ditangani operator: gambar dihapus dan job boleh dipangkas.
+        Mengembalikan job, None jika tidak ada, atau melempar ValueError jika job tidak gagal.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        if job["status"] != STATUS_FAILED:
+            raise ValueError("Hanya job gagal yang bisa di-dismiss.")
+        self._remove_image(job)
+        self._update(job, dismissed=True)
+        return job
+
+    async def start(self):
+        """Menjalankan worker dan menjadwalkan ulang job yang tertunda dari run sebelumnya."""
+        self._queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        for job in self.jobs.values():
+            if job["status"] not in PENDING_STATUSES:
+                continue
+            if job["status"] != STATUS_WAITING:
+                job["status"] = STATUS_RETRYING if job["attempts"] else STATUS_QUEUED
+            self._schedule(loop, job)
+        self._save_jobs()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # --- Internal ---
+    def _schedule(self, loop, job):
+        delay = 0
+        if job.get("next_attempt_at"):
+            next_attempt = datetime.datetime.fromisoformat(job["next_attempt_at"])
+            delay = max(0.0, (next_attempt - datetime.datetime.now()).total_seconds())
+        if delay > 0:
+            loop.call_later(delay, self._queue.put_nowait, job["job_id"])
+        else:
+            self._queue.put_nowait(job["job_id"])
+
+    def _update(self, job, **fields):
+        job.update(fields)
+        job["updated_at"] = datetime.datetime.now().isoformat()
+        self._save_jobs()
+
+    def _finish(self, job, status, status_code, result, error=None):
+        job.update(status=status, status_code=status_code, result=result,
+                   last_error=error, next_attempt_at=None)
+        job["updated_at"] = datetime.datetime.now().isoformat()
+        self._prune_finished()
+        self._save_jobs()
+        if status == STATUS_DONE:
+            self._remove_image(job) # Gambar job gagal disimpan agar bisa dijalankan ulang
+        event = self._events.pop(job["job_id"], None)
+        if event is not None:
+            event.set()
+        self._wake_waiting()
+
+    def _remove_image(self, job):
+        image_path = os.path.join(BASE_DIR, job["image_path"])
+        if os.path.exists(image_path):
+            os.remove(image_path)
+
+    def _wake_waiting(self):
+        """Memasukkan kembali job yang menunggu agar urutannya dicek ulang."""
+        waiting, self._waiting = self._waiting, set()
+        for job_id in waiting:
+            self._queue.put_nowait(job_id)
+
+    def _blocking_job(self, job):
+        """
+        Mengembalikan job tertunda yang diambil lebih awal (captured_at) dan platnya sama
+        atau belum diketahui. Hasil job harus diterapkan setelah job tersebut, supaya
+        misalnya "out" tidak diproses sebelum "in" untuk kendaraan yang sama.
+        """
+        order = (job["captured_at"], job["created_at"])
+        for other in self.jobs.values():
+            if other is job or other["status"] not in PENDING_STATUSES:
+                continue
+            if (other["captured_at"], other["created_at"]) >= order:
+                continue
+            if other.get("plat_nomor") is None or other["plat_nomor"] == job["plat_nomor"]:
+                return other
+        return None
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            # Job yang sedang diproses worker lain tidak boleh dijalankan dua kali
+            if job is None or job["status"] not in PENDING_STATUSES or job["status"] == STATUS_PROCESSING:
+                continue
+
+            try:
+                await self._run_job(loop, job)
+            except Exception as e:
+                print(f"Error tak terduga pada job {job_id}: {e}")
+                self._finish(job, STATUS_FAILED, 500, {"status": "error", "message": str(e)}, error=str(e))
+
+    async def _run_job(self, loop, job):
+        image_path = os.path.join(BASE_DIR, job["image_path"])
+        if not os.path.exists(image_path):
+            self._finish(job, STATUS_FAILED, 404, {"status": "error", "message": "File gambar job tidak ditemukan."},
+                         error="image missing")
+            return
+
+        recognition_result = job.get("recognition_result")
+        if recognition_result is None:
+            # Circuit breaker terbuka: tunda tanpa menghitung sebagai percobaan
+            if not self.breaker.allow_request():
+                wait = self.breaker.seconds_until_retry() or 1
+                loop.call_later(wait, self._queue.put_nowait, job["job_id"])
+                return
+
+            self._update(job, status=STATUS_PROCESSING, attempts=job["attempts"] + 1)
+            with open(image_path, "rb") as f:
+                image_bytes = f.read()
+
+            try:
+                recognition_result = await self.recognize(image_bytes)
+            except Exception as e:
+                self.breaker.record_failure()
+                self._retry_or_fail(loop, job, str(e))
+                return
+            self.breaker.record_success()
+
+            plat = recognition_result.get("Plat_Nomor")
+            if plat not in (None, PARSE_ERROR, PLATE_NOT_DETECTED):
+                # Simpan hasil rekognisi agar job yang ditunda tidak memanggil model lagi
+                self._update(job, plat_nomor=plat.upper().replace(" ", ""), recognition_result=recognition_result)
+                self._wake_waiting() # Plat job ini sekarang diketahui, job lain mungkin tidak lagi tertahan
+
+        if job.get("plat_nomor") is not None:
+            blocking = self._blocking_job(job)
+            if blocking is not None:
+                self._update(job, status=STATUS_WAITING,
+                             last_error=f"Menunggu job {blocking['job_id']} yang diambil lebih awal.")
+                self._waiting.add(job["job_id"])
+                return
+
+        try:
+            status_code, content = self.apply_result(job, recognition_result)
+        except RetryableRecognitionError as e:
+            self._retry_or_fail(loop, job, str(e), parse_failure=True)
+            return
+
+        # process_entry/process_exit mengembalikan status "error" dengan HTTP 200 (mis. kendaraan tidak ditemukan)
+        if status_code < 400 and content.get("status") != "error":
+            status = STATUS_DONE
+        else:
+            status = STATUS_FAILED
+        self._finish(job, status, status_code, content)
+
+    def _retry_or_fail(self, loop, job, error, parse_failure=False):
+        """
+        Error API/timeout dicoba ulang sampai RETRY_DEADLINE_SECONDS sejak job dibuat (atau
+        di-requeue), berapa pun jumlah percobaannya, sehingga gangguan API yang panjang tidak
+        menggagalkan job. Output yang tidak bisa diparsing (API sehat) dibatasi MAX_PARSE_ATTEMPTS.
+        """
+        if parse_failure:
+            job["parse_failures"] = job.get("parse_failures", 0) + 1
+            give_up = job["parse_failures"] >= MAX_PARSE_ATTEMPTS
+        else:
+            retry_since = datetime.datetime.fromisoformat(job.get("retry_since") or job["created_at"])
+            age = (datetime.datetime.now() - retry_since).total_seconds()
+            give_up = age >= RETRY_DEADLINE_SECONDS
+        if give_up:
+            print(f"Job {job['job_id']} gagal setelah {job['attempts']} percobaan: {error}")
+            self._finish(job, STATUS_FAILED, 503, {"status": "error", "message": f"Rekognisi gagal: {error}"}, error=error)
+            return
+        delay = backoff_delay(job["attempts"])
+        next_attempt_at = (datetime.datetime.now() + datetime.timedelta(seconds=delay)).isoformat()
+        self._update(job, status=STATUS_RETRYING, last_error=error, next_attempt_at=next_attempt_at)
+        loop.call_later(delay, self._queue.put_nowait, job["job_id"])
@@ -29,9 +29,44 @@ document.addEventListener("DOMContentLoaded", () => {
   const parkingHistoryTableBody = document.querySelector(
     "#parkingHistoryTable tbody"
   );
+  const parkingHistoryHeaders = document.querySelectorAll(
+    "#parkingHistoryTable th[data-sort-key]"
+  );
+  const historyScroll = document.getElementById("historyScroll");
+  const historySearch = document.getElementById("historySearch");
+  const historyCount = document.getElementById("historyCount");
 
   let selectedFile = null;
 
+  // --- State tabel parkir ---
+  // Data disimpan di array/Map di memori; DOM hanya menampilkan baris yang terlihat.
+  const HISTORY_COLUMNS = 6;
+  const OVERSCAN_ROWS = 10; // Baris ekstra di atas/bawah area terlihat agar scroll tidak berkedip
+  let lastParkingDataEtag = null;
+  const currentRows = new Map(); // plat -> <tr> di tabel kendaraan parkir
+  let historyRecords = new Map(); // plat -> record riwayat (dengan sel tampilan yang sudah diformat)
+  let historyView = []; // Hasil filter + sort dari historyRecords
+  let historySort = { key: "exit_time", direction: -1 };
+  let historyQuery = "";
+  let historyRowHeight = 0;
+  let historyRenderScheduled = false;
+  const historyRowPool = [];
+
+  // Idempotency-Key per aksi: dipakai ulang selama request untuk gambar yang sama belum
+  // mendapat respons (double-click, retry jaringan), lalu dibuang setelah ada respons.
+  const pendingIdempotencyKeys = {};
+
+  function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+  }
+
+  function resetIdempotencyKeys() {
+    Object.keys(pendingIdempotencyKeys).forEach(
+      (action) => delete pendingIdempotencyKeys[action]
+    );
+  }
+
   async function loadLabeledImages() {
     try {
       const response = await fetch("/labeled_images");
@@ -52,8 +87,10 @@ document.addEventListener("DOMContentLoaded", () => {
   }
 
   labeledImageSelect.addEventListener("change", () => {
+    resetIdempotencyKeys(); // Gambar berbeda = kejadian gerbang baru
     if (labeledImageSelect.value !== "none") {
-      imagePreview.src = `/${labeledImageSelect.value}`;
+      // Pakai thumbnail dari cache server, bukan JPEG resolusi penuh
+      imagePreview.src = `/thumbnail/${labeledImageSelect.value}?width=640`;
       imagePreview.style.display = "block";
       selectedFile = null;
       imageUpload.value = "";
@@ -67,6 +104,7 @@ document.addEventListener("DOMContentLoaded", () => {
   });
 
   imageUpload.addEventListener("change", (event) => {
+    resetIdempotencyKeys();
     selectedFile = event.target.files[0];
     if (selectedFile) {
       const reader = new FileReader();
@@ -107,12 +145,23 @@ document.addEventListener("DOMContentLoaded", () => {
     setStatusMessage("Memproses permintaan...", "loading");
     hideResults();
 
+    const idempotencyKey =
+      pendingIdempotencyKeys[actionType] ||
+      (pendingIdempotencyKeys[actionType] = newIdempotencyKey());
+
     try {
       const response = await fetch("/process_image/", {
         method: "POST",
+        headers: { "Idempotency-Key": idempotencyKey },
         body: formData,
       });
 
+      // Server sudah menjawab; klik berikutnya dianggap kejadian baru.
+      // Respons 5xx tidak disimpan server, jadi key tetap dipakai untuk mencoba ulang.
+      if (response.status < 500 && pendingIdempotencyKeys[actionType] === idempotencyKey) {
+        delete pendingIdempotencyKeys[actionType];
+      }
+
       const result = await response.json(); // This is the final_response from backend
 
       if (!response.ok) {
@@ -215,51 +264,264 @@ document.addEventListener("DOMContentLoaded", () => {
     accuracyResultDiv.style.display = "block";
   }
 
+  function formatDateTime(value) {
+    return value ? new Date(value).toLocaleString() : "N/A";
+  }
+
+  function formatNumber(value) {
+    return value !== undefined && value !== null ? value : "N/A";
+  }
+
+  function formatFee(value) {
+    return value !== undefined && value !== null
+      ? value.toLocaleString("id-ID")
+      : "N/A";
+  }
+
+  // Mengubah respons kolom (/parking_data?format=columnar) menjadi array record
+  function columnsToRecords(data) {
+    const columns = data.columns;
+    const names = Object.keys(columns);
+    const records = new Array(data.count);
+    for (let i = 0; i < data.count; i++) {
+      const record = {};
+      names.forEach((name) => {
+        record[name] = columns[name][i];
+      });
+      records[i] = record;
+    }
+    return records;
+  }
+
+  function recordSignature(vehicle) {
+    return [
+      vehicle.original_plat,
+      vehicle.vehicle_type,
+      vehicle.entry_time,
+      vehicle.exit_time,
+      vehicle.duration_minutes,
+      vehicle.fee,
+    ].join("|");
+  }
+
+  // Hanya menulis textContent jika nilainya berubah, agar browser tidak re-layout sia-sia
+  function updateRowCells(row, cells) {
+    cells.forEach((text, i) => {
+      const cell = row.cells[i];
+      const value = String(text);
+      if (cell.textContent !== value) cell.textContent = value;
+    });
+  }
+
   async function fetchParkingData() {
     try {
-      const response = await fetch("/parking_data");
+      const response = await fetch("/parking_data?format=columnar");
       if (!response.ok) throw new Error("Gagal memuat data parkir");
+      const etag = response.headers.get("ETag");
+      if (etag && etag === lastParkingDataEtag) return; // Data belum berubah
       const data = await response.json();
+      lastParkingDataEtag = etag;
 
-      currentParkingTableBody.innerHTML = "";
-      parkingHistoryTableBody.innerHTML = "";
-
-      Object.values(data).forEach((vehicle) => {
-        const originalPlat = vehicle.original_plat || vehicle.plat_nomor;
-
+      const current = [];
+      const nextHistory = new Map();
+      columnsToRecords(data).forEach((vehicle) => {
+        const key = vehicle.plat_key;
         if (vehicle.exit_time === null) {
-          const row = currentParkingTableBody.insertRow();
-          row.insertCell().textContent = originalPlat;
-          row.insertCell().textContent = vehicle.vehicle_type;
-          row.insertCell().textContent = vehicle.entry_time
-            ? new Date(vehicle.entry_time).toLocaleString()
-            : "N/A";
-        } else {
-          const row = parkingHistoryTableBody.insertRow();
-          row.insertCell().textContent = originalPlat;
-          row.insertCell().textContent = vehicle.vehicle_type;
-          row.insertCell().textContent = vehicle.entry_time
-            ? new Date(vehicle.entry_time).toLocaleString()
-            : "N/A";
-          row.insertCell().textContent = vehicle.exit_time
-            ? new Date(vehicle.exit_time).toLocaleString()
-            : "N/A";
-          row.insertCell().textContent =
-            vehicle.duration_minutes !== undefined
-              ? vehicle.duration_minutes
-              : "N/A";
-          row.insertCell().textContent =
-            vehicle.fee !== undefined
-              ? vehicle.fee.toLocaleString("id-ID")
-              : "N/A";
+          current.push(vehicle);
+          return;
         }
+        const signature = recordSignature(vehicle);
+        const previous = historyRecords.get(key);
+        // Record yang tidak berubah dipakai ulang, termasuk sel yang sudah diformat
+        if (previous && previous.signature === signature) {
+          nextHistory.set(key, previous);
+          return;
+        }
+        nextHistory.set(key, {
+          key,
+          signature,
+          vehicle,
+          searchText: `${vehicle.original_plat || key} ${vehicle.vehicle_type}`.toLowerCase(),
+          cells: [
+            vehicle.original_plat || key,
+            vehicle.vehicle_type,
+            formatDateTime(vehicle.entry_time),
+            formatDateTime(vehicle.exit_time),
+            formatNumber(vehicle.duration_minutes),
+            formatFee(vehicle.fee),
+          ],
+        });
       });
+
+      renderCurrentParking(current);
+      historyRecords = nextHistory;
+      refreshHistoryView();
     } catch (error) {
       console.error("Error fetching parking data:", error);
       setStatusMessage("Gagal memuat data parkir.", "error");
     }
   }
 
+  // Diff berbasis plat: hanya baris yang berubah, baru, atau hilang yang menyentuh DOM
+  function renderCurrentParking(vehicles) {
+    const seen = new Set();
+    vehicles.forEach((vehicle, index) => {
+      const key = vehicle.plat_key;
+      const signature = recordSignature(vehicle);
+      seen.add(key);
+
+      let row = currentRows.get(key);
+      if (!row) {
+        row = document.createElement("tr");
+        for (let i = 0; i < 3; i++) row.insertCell();
+        currentRows.set(key, row);
+      }
+      if (row.dataset.signature !== signature) {
+        row.dataset.signature = signature;
+        updateRowCells(row, [
+          vehicle.original_plat || key,
+          vehicle.vehicle_type,
+          formatDateTime(vehicle.entry_time),
+        ]);
+      }
+      const rowAtIndex = currentParkingTableBody.children[index];
+      if (rowAtIndex !== row) {
+        currentParkingTableBody.insertBefore(row, rowAtIndex || null);
+      }
+    });
+
+    currentRows.forEach((row, key) => {
+      if (!seen.has(key)) {
+        row.remove();
+        currentRows.delete(key);
+      }
+    });
+  }
+
+  function compareValues(a, b) {
+    if (a === b) return 0;
+    if (a === null || a === undefined) return 1;
+    if (b === null || b === undefined) return -1;
+    return a < b ? -1 : 1;
+  }
+
+  // Filter + sort dilakukan di array memori, lalu hanya area terlihat yang dirender
+  function refreshHistoryView() {
+    const query = historyQuery;
+    const { key, direction } = historySort;
+    historyView = [];
+    historyRecords.forEach((record) => {
+      if (!query || record.searchText.includes(query)) historyView.push(record);
+    });
+    historyView.sort(
+      (a, b) => direction * compareValues(a.vehicle[key], b.vehicle[key])
+    );
+
+    historyCount.textContent = query
+      ? `${historyView.length} dari ${historyRecords.size} sesi`
+      : `${historyRecords.size} sesi`;
+    parkingHistoryHeaders.forEach((th) => {
+      th.classList.toggle("sorted-asc", th.dataset.sortKey === key && direction === 1);
+      th.classList.toggle("sorted-desc", th.dataset.sortKey === key && direction === -1);
+    });
+    renderHistoryRows();
+  }
+
+  function createSpacerRow() {
+    const row = document.createElement("tr");
+    row.className = "virtual-spacer";
+    const cell = row.insertCell();
+    cell.colSpan = HISTORY_COLUMNS;
+    return row;
+  }
+
+  const historyTopSpacer = createSpacerRow();
+  const historyBottomSpacer = createSpacerRow();
+  parkingHistoryTableBody.appendChild(historyTopSpacer);
+  parkingHistoryTableBody.appendChild(historyBottomSpacer);
+
+  function acquireHistoryRow(index) {
+    while (historyRowPool.length <= index) {
+      const row = document.createElement("tr");
+      for (let i = 0; i < HISTORY_COLUMNS; i++) row.insertCell();
+      parkingHistoryTableBody.insertBefore(row, historyBottomSpacer);
+      historyRowPool.push(row);
+    }
+    return historyRowPool[index];
+  }
+
+  function measureHistoryRowHeight() {
+    if (historyRowHeight || historyView.length === 0) return;
+    const row = acquireHistoryRow(0);
+    updateRowCells(row, historyView[0].cells);
+    row.style.display = "";
+    historyRowHeight = row.getBoundingClientRect().height || 40;
+  }
+
+  // Virtual scrolling: baris dari pool dipakai ulang untuk record yang sedang terlihat,
+  // sisa tinggi tabel diisi oleh dua baris spacer.
+  function renderHistoryRows() {
+    historyRenderScheduled = false;
+    measureHistoryRowHeight();
+    const rowHeight = historyRowHeight || 40;
+    const total = historyView.length;
+    const viewportRows = Math.ceil(historyScroll.clientHeight / rowHeight) || 20;
+    const first = Math.max(
+      0,
+      Math.floor(historyScroll.scrollTop / rowHeight) - OVERSCAN_ROWS
+    );
+    const last = Math.min(total, first + viewportRows + OVERSCAN_ROWS * 2);
+
+    historyTopSpacer.style.height = `${first * rowHeight}px`;
+    historyBottomSpacer.style.height = `${(total - last) * rowHeight}px`;
+
+    const visibleCount = last - first;
+    for (let i = 0; i < visibleCount; i++) {
+      const record = historyView[first + i];
+      const row = acquireHistoryRow(i);
+      row.style.display = "";
+      row.classList.toggle("striped", (first + i) % 2 === 1);
+      if (row.dataset.key !== record.key || row.dataset.signature !== record.signature) {
+        row.dataset.key = record.key;
+        row.dataset.signature = record.signature;
+        updateRowCells(row, record.cells);
+      }
+    }
+    for (let i = visibleCount; i < historyRowPool.length; i++) {
+      historyRowPool[i].style.display = "none";
+    }
+  }
+
+  function scheduleHistoryRender() {
+    if (historyRenderScheduled) return;
+    historyRenderScheduled = true;
+    requestAnimationFrame(renderHistoryRows);
+  }
+
+  historyScroll.addEventListener("scroll", scheduleHistoryRender);
+  window.addEventListener("resize", scheduleHistoryRender);
+
+  let historySearchTimer = null;
+  historySearch.addEventListener("input", () => {
+    clearTimeout(historySearchTimer);
+    historySearchTimer = setTimeout(() => {
+      historyQuery = historySearch.value.trim().toLowerCase();
+      historyScroll.scrollTop = 0;
+      refreshHistoryView();
+    }, 150);
+  });
+
+  parkingHistoryHeaders.forEach((th) => {
+    th.addEventListener("click", () => {
+      const key = th.dataset.sortKey;
+      historySort =
+        historySort.key === key
+          ? { key, direction: -historySort.direction }
+          : { key, direction: 1 };
+      refreshHistoryView();
+    });
+  });
+
   // Initial load
   loadLabeledImages();
   fetchParkingData();
@@ -0,0 +1,101 @@
+import hashlib
+import io
+import os
+import tempfile
+
+from PIL import Image, ImageOps, features
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+THUMBNAIL_CACHE_DIR = os.path.join(BASE_DIR, "thumbnail_cache")
+
+# Lebar yang diizinkan dibatasi agar cache tidak membengkak karena variasi ukuran
+ALLOWED_WIDTHS = (160, 320, 640)
+DEFAULT_WIDTH = 320
+WEBP_SUPPORTED = features.check("webp")
+DEFAULT_FORMAT = "webp" if WEBP_SUPPORTED else "jpeg"
+FORMAT_MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+QUALITY = 80
+VERSION_LENGTH = 16 # Panjang versi konten (?v=) yang dipakai di URL thumbnail
+
+# Cache digest file sumber: path -> (mtime_ns, size, sha256), supaya file tidak di-hash ulang tiap request
+_source_digests = {}
+
+
+def normalize_width(width: int):
+    """Membulatkan lebar ke atas ke ukuran yang diizinkan terdekat."""
+    for allowed in ALLOWED_WIDTHS:
+        if width <= allowed:
+            return allowed
+    return ALLOWED_WIDTHS[-1]
+
+
+def normalize_format(fmt: str):
+    fmt = (fmt or DEFAULT_FORMAT).lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in FORMAT_MEDIA_TYPES or (fmt == "webp" and not WEBP_SUPPORTED):
+        return "jpeg"
+    return fmt
+
+
+def source_digest(source_path: str):
+    """SHA-256 dari isi file sumber, di-cache berdasarkan mtime dan ukuran file."""
+    stat = os.stat(source_path)
+    cached = _source_digests.get(source_path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    hasher = hashlib.sha256()
+    with open(source_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+    digest = hasher.hexdigest()
+    _source_digests[source_path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def content_version(source_path: str):
+    """Versi singkat isi file sumber, untuk parameter ?v= di URL thumbnail."""
+    return source_digest(source_path)[:VERSION_LENGTH]
+
+
+def thumbnail_key(source_path: str, width: int, fmt: str):
+    """Kunci cache berbasis konten: berubah jika isi gambar, lebar, atau format berubah."""
+    return hashlib.sha256(f"{source_digest(source_path)}:{width}:{fmt}".encode()).hexdigest()
+
+
+def get_thumbnail(source_path: str, width: int = DEFAULT_WIDTH, fmt: str = DEFAULT_FORMAT):
+    """
+    Mengembalikan (path_thumbnail, cache_key) untuk gambar sumber.
+    Thumbnail dibuat dengan Pillow saat pertama diminta lalu disimpan di THUMBNAIL_CACHE_DIR.
+    """
+    width = normalize_width(width)
+    fmt = normalize_format(fmt)
+    key = thumbnail_key(source_path, width, fmt)
+    thumb_path = os.path.join(THUMBNAIL_CACHE_DIR, key[:2], f"{key}.{fmt}")
+    if os.path.exists(thumb_path):
+        return thumb_path, key
+
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB")
+        if img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, format=fmt.upper(), quality=QUALITY)
+
+    thumb_dir = os.path.dirname(thumb_path)
+    os.makedirs(thumb_dir, exist_ok=True)
+    # File sementara unik per pemanggil (juga antar thread), lalu di-rename secara atomic:
+    # pembaca tidak pernah melihat file setengah jadi, dan penulis paralel tidak saling menimpa.
+    fd, tmp_path = tempfile.mkstemp(dir=thumb_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, thumb_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if not os.path.exists(thumb_path): # Penulis lain sudah berhasil = cache hit
+            raise
+    return thumb_path, key
@@ -1,11 +1,29 @@
 import datetime
 import json
 import os
+import uuid
 
 PARKING_DATA_FILE = "parking_data.json"
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PARKING_DATA_PATH = os.path.join(BASE_DIR, PARKING_DATA_FILE)
 
+# Penghitung perubahan data parkir, dipakai sebagai ETag oleh endpoint /parking_data.
+# STORE_EPOCH berbeda tiap proses agar versi dari run sebelumnya tidak dianggap sama.
+STORE_EPOCH = uuid.uuid4().hex[:8]
+_store_version = 0
+_last_seen_mtime = None
+
+
+def parse_local_time(value: str):
+    """
+    Parsing waktu ISO menjadi datetime lokal tanpa zona waktu (naive), format yang dipakai
+    di seluruh parking_data.json. Waktu dengan offset (mis. +07:00) dikonversi ke waktu lokal.
+    Melempar ValueError jika format tidak valid.
+    """
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
 
 def load_parking_data():
     if not os.path.exists(PARKING_DATA_PATH):
@@ -17,13 +35,35 @@ def load_parking_data():
         return {} # Return empty if file is corrupted or empty
 
 def save_parking_data(data):
+    global _store_version, _last_seen_mtime
     with open(PARKING_DATA_PATH, 'w') as f:
         json.dump(data, f, indent=4)
+    _store_version += 1
+    _last_seen_mtime = _current_mtime()
+
+def _current_mtime():
+    try:
+        return os.stat(PARKING_DATA_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def get_data_version():
+    """
+    Mengembalikan versi data parkir saat ini (berubah setiap kali data disimpan).
+    Perubahan file dari luar proses ini juga terdeteksi lewat mtime.
+    """
+    global _store_version, _last_seen_mtime
+    mtime = _current_mtime()
+    if mtime != _last_seen_mtime:
+        _store_version += 1
+        _last_seen_mtime = mtime
+    return f"{STORE_EPOCH}-{_store_version}"
 
-def process_entry(plat_nomor: str, vehicle_type: str):
+def process_entry(plat_nomor: str, vehicle_type: str, event_time: str = None):
     """
     Memproses masuknya kendaraan.
     Mencatat waktu masuk ke parking_data.json.
+    event_time (ISO) dipakai sebagai waktu masuk jika diberikan, misalnya waktu gambar diambil.
     """
     parking_data = load_parking_data()
     plat_nomor_cleaned = plat_nomor.upper().replace(" ", "")
@@ -35,7 +75,7 @@ def process_entry(plat_nomor: str, vehicle_type: str):
             "entry_time": parking_data[plat_nomor_cleaned]["entry_time"]
         }
 
-    entry_time = datetime.datetime.now().isoformat()
+    entry_time = parse_local_time(event_time).isoformat() if event_time else datetime.datetime.now().isoformat()
     parking_data[plat_nomor_cleaned] = {
         "vehicle_type": vehicle_type,
         "entry_time": entry_time,
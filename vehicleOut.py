@@ -4,7 +4,7 @@ import math
 import os
 
 # Menggunakan fungsi load/save dari vehicleIn agar konsisten
-from vehicleIn import load_parking_data, save_parking_data
+from vehicleIn import load_parking_data, save_parking_data, parse_local_time
 
 def calculate_fee(minutes: int, vehicle_type: str):
     """
@@ -26,10 +26,11 @@ def calculate_fee(minutes: int, vehicle_type: str):
             return 2000 + additional_hours * 2000
     return 0
 
-def process_exit(plat_nomor: str, detected_vehicle_type: str): # Tambahkan detected_vehicle_type
+def process_exit(plat_nomor: str, detected_vehicle_type: str, event_time: str = None): # Tambahkan detected_vehicle_type
     """
     Memproses keluarnya kendaraan.
     Menghitung durasi, biaya, dan memperbarui parking_data.json.
+    event_time (ISO) dipakai sebagai waktu keluar jika diberikan, misalnya waktu gambar diambil.
     """
     parking_data = load_parking_data()
     plat_nomor_cleaned = plat_nomor.upper().replace(" ", "")
@@ -46,14 +47,14 @@ def process_exit(plat_nomor: str, detected_vehicle_type: str): # Tambahkan detec
     vehicle_type_at_entry = record["vehicle_type"] 
 
     try:
-        entry_time = datetime.datetime.fromisoformat(record["entry_time"])
+        entry_time = parse_local_time(record["entry_time"])
     except ValueError:
          return {
             "status": "error",
             "message": f"Format waktu masuk tidak valid untuk plat {plat_nomor}."
         }
 
-    exit_time = datetime.datetime.now()
+    exit_time = parse_local_time(event_time) if event_time else datetime.datetime.now()
     duration_seconds = (exit_time - entry_time).total_seconds()
     # duration_minutes = int(duration_seconds / 60)
     duration_minutes = int(math.ceil(600))  # Buat debugging lebih mudah, pakai 600 menit